@@ -4,12 +4,24 @@ import sys
 import time
 import logging
 from pathlib import Path
-from src.gdcm_anonymizer import GdcmAnonymizer
-import subprocess
+from src.gdcm_anonymizer import GdcmAnonymizer, list_dicom_files
+from src.convert_to_nifti import convert_dicom_to_nifti
+from src.segment_bones import segment_directory
+from src.visualize_results import visualize_directory
 import signal
 import os
 import shutil
 
+# Directory listings of .dcm files, cached for the duration of a pipeline run
+_dcm_listings = {}
+
+def _list_dcm(path):
+    """List the .dcm files in a directory, once per pipeline run"""
+    key = str(path)
+    if key not in _dcm_listings:
+        _dcm_listings[key] = list_dicom_files(key)
+    return _dcm_listings[key]
+
 def setup_logging():
     logging.basicConfig(
         level=logging.INFO,
@@ -29,7 +41,7 @@ def check_prerequisites(logger):
             return False
     
     # Check for DICOM files
-    dicom_files = list(Path('data/raw').glob('*.dcm'))
+    dicom_files = _list_dcm('data/raw')
     if not dicom_files:
         logger.error("No DICOM files found in data/raw directory")
         return False
@@ -37,23 +49,23 @@ def check_prerequisites(logger):
     logger.info(f"Found {len(dicom_files)} DICOM files to process")
     return True
 
-def run_anonymization(logger):
+def run_anonymization(logger, dicom_files):
     """Run DICOM anonymization"""
     logger.info("Starting DICOM anonymization...")
     try:
         anonymizer = GdcmAnonymizer()
         
         # Start anonymization
-        audit_info = anonymizer.anonymize_dicom('data/raw', 'data/anonymized')
+        audit_info = anonymizer.anonymize_dicom('data/raw', 'data/anonymized', dicom_files)
         
         # Check if files were anonymized
-        anonymized_files = list(Path('data/anonymized').glob('*.dcm'))
+        anonymized_files = _list_dcm('data/anonymized')
         if not anonymized_files:
             logger.error("No anonymized files were produced")
             return False
         
         # Validate anonymization
-        is_valid = anonymizer.validate_anonymization('data/anonymized')
+        is_valid = anonymizer.validate_anonymization('data/anonymized', anonymized_files)
         logger.info(f"Anonymization validation: {is_valid}")
         
         return is_valid
@@ -66,14 +78,7 @@ def run_conversion(logger):
     """Run DICOM to NIfTI conversion"""
     logger.info("Starting DICOM to NIfTI conversion...")
     try:
-        cmd = [
-            'python', 'src/convert_to_nifti.py'
-        ]
-        
-        process = subprocess.run(cmd, capture_output=True, text=True)
-        if process.returncode != 0:
-            logger.error(f"Conversion failed: {process.stderr}")
-            return False
+        convert_dicom_to_nifti('data/anonymized', 'data/preprocessed')
         
         # Check for output files
         nifti_files = list(Path('data/preprocessed').glob('*.nii.gz'))
@@ -97,14 +102,7 @@ def run_segmentation(logger):
             logger.error("No preprocessed files found to segment")
             return False
         
-        cmd = [
-            'python', 'src/segment_bones.py'
-        ]
-        
-        process = subprocess.run(cmd, capture_output=True, text=True)
-        if process.returncode != 0:
-            logger.error(f"Segmentation failed: {process.stderr}")
-            return False
+        segment_directory('data/preprocessed', 'data/bone_segmentation')
         
         # Check for output files
         segmented_files = list(Path('data/bone_segmentation').glob('*.nii.gz'))
@@ -123,14 +121,7 @@ def run_visualization(logger):
     """Run visualization of segmentation results"""
     logger.info("Creating visualizations...")
     try:
-        cmd = [
-            'python', 'src/visualize_results.py'
-        ]
-        
-        process = subprocess.run(cmd, capture_output=True, text=True)
-        if process.returncode != 0:
-            logger.error(f"Visualization failed: {process.stderr}")
-            return False
+        visualize_directory('data/preprocessed', 'data/bone_segmentation')
         
         # Check for output files
         vis_dir = Path('data/bone_segmentation/visualizations')
@@ -177,7 +168,7 @@ def main():
             sys.exit(1)
         
         # Run anonymization
-        if not run_anonymization(logger):
+        if not run_anonymization(logger, _list_dcm('data/raw')):
             logger.error("Anonymization failed")
             cleanup(logger)
             sys.exit(1)
@@ -1,13 +1,23 @@
 #!/usr/bin/env python3
 
 import os
-import pydicom
-import numpy as np
-import nibabel as nib
 from pathlib import Path
-from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 import SimpleITK as sitk
 
+# Number of NIfTI writes running alongside series reads; each holds one image in memory
+MAX_PENDING_WRITES = 4
+
+def _finish_writes(futures, pending_writes):
+    """Report the result of finished writes and drop them from pending_writes"""
+    for future in futures:
+        series_id, output_file = pending_writes.pop(future)
+        try:
+            future.result()
+            print(f"Saved {output_file}")
+        except Exception as e:
+            print(f"Error converting series {series_id}: {str(e)}")
+
 def convert_dicom_to_nifti(input_dir: str, output_dir: str):
     """
     Convert DICOM files to NIfTI format
@@ -16,62 +26,48 @@ def convert_dicom_to_nifti(input_dir: str, output_dir: str):
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
     
-    # Get all DICOM files
-    dicom_files = sorted(list(input_path.glob("*.dcm")))
-    if not dicom_files:
-        raise FileNotFoundError(f"No DICOM files found in {input_dir}")
-    
-    print(f"Found {len(dicom_files)} DICOM files")
-    
-    # Group DICOM files by series
-    series_dict = {}
-    for dicom_file in tqdm(dicom_files, desc="Grouping DICOM files"):
-        try:
-            ds = pydicom.dcmread(str(dicom_file))
-            series_id = str(ds.SeriesInstanceUID)
-            if series_id not in series_dict:
-                series_dict[series_id] = []
-            series_dict[series_id].append(dicom_file)
-        except Exception as e:
-            print(f"Error reading {dicom_file}: {str(e)}")
-            continue
-    
-    print(f"Found {len(series_dict)} unique series")
+    # Group DICOM files by series using GDCM's native series indexer,
+    # which scans input_dir itself
+    series_ids = sitk.ImageSeriesReader.GetGDCMSeriesIDs(str(input_path))
+    if not series_ids:
+        raise FileNotFoundError(f"No DICOM series found in {input_dir}")
+    print(f"Found {len(series_ids)} unique series")
     
-    # Convert each series to NIfTI
-    for series_id, files in series_dict.items():
-        try:
-            print(f"\nProcessing series {series_id} with {len(files)} files")
-            
-            # Read series using SimpleITK
-            reader = sitk.ImageSeriesReader()
-            reader.SetFileNames([str(f) for f in files])
-            image = reader.Execute()
-            
-            # Get original spacing and direction
-            spacing = image.GetSpacing()
-            direction = image.GetDirection()
-            origin = image.GetOrigin()
-            
-            # Convert to numpy array
-            array = sitk.GetArrayFromImage(image)
-            
-            # Create NIfTI image
-            nifti_img = nib.Nifti1Image(array, np.eye(4))
+    # Convert each series to NIfTI, overlapping the compressed writes
+    # of finished series with reading the next one
+    reader = sitk.ImageSeriesReader()
+    pending_writes = {}
+    with ThreadPoolExecutor(max_workers=MAX_PENDING_WRITES) as executor:
+        for idx, series_id in enumerate(series_ids):
+            # Bound how many read images wait on their writes before reading another
+            if len(pending_writes) >= MAX_PENDING_WRITES:
+                done, _ = wait(pending_writes, return_when=FIRST_COMPLETED)
+                _finish_writes(done, pending_writes)
             
-            # Set header information
-            header = nifti_img.header
-            header.set_xyzt_units(xyz='mm')
-            header['pixdim'][1:4] = spacing[::-1]  # Reverse order for NIfTI
-            
-            # Save NIfTI file
-            output_file = output_path / f"series_{len(series_dict)}.nii.gz"
-            nib.save(nifti_img, str(output_file))
-            print(f"Saved {output_file}")
-            
-        except Exception as e:
-            print(f"Error converting series {series_id}: {str(e)}")
-            continue
+            try:
+                # File names come back sorted by slice position
+                files = sitk.ImageSeriesReader.GetGDCMSeriesFileNames(str(input_path), series_id)
+                print(f"\nProcessing series {series_id} with {len(files)} files")
+                
+                # Read series using SimpleITK
+                reader.SetFileNames(files)
+                image = reader.Execute()
+                
+                # Save NIfTI file; SimpleITK keeps spacing, direction and origin.
+                # gzip level 1 is much faster than the default for a small size cost
+                output_file = output_path / f"series_{idx:04d}.nii.gz"
+                future = executor.submit(
+                    sitk.WriteImage, image, str(output_file),
+                    useCompression=True, compressionLevel=1
+                )
+                pending_writes[future] = (series_id, output_file)
+                del image
+                
+            except Exception as e:
+                print(f"Error converting series {series_id}: {str(e)}")
+                continue
+        
+        _finish_writes(as_completed(list(pending_writes)), pending_writes)
 
 def main():
     input_dir = "data/anonymized"
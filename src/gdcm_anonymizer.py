@@ -3,18 +3,230 @@
 import gdcm
 import logging
 import json
+import base64
 from pathlib import Path
 from datetime import datetime
-from cryptography.fernet import Fernet
-from typing import Dict, List, Optional
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from typing import Dict, List, Optional, Tuple
 import shutil
 import yaml
 import pydicom
 from tqdm import tqdm
 import os
 import tempfile
+import hashlib
+import mmap
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pydicom.dataelem import DataElement
 from pydicom.valuerep import PersonName
+from pydicom.tag import Tag
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library json module
+    orjson = None
+
+# PHI rules shared by all validation checks:
+# (keyword, expected anonymized prefix, critical, exact)
+# Critical tags must always carry the anonymized value; the others may also be empty.
+# The remaining-PHI check requires an exact match for exact tags and the prefix otherwise.
+_PHI_RULES = [
+    ('PatientName', 'ANONYMOUS', True, True),
+    ('PatientID', 'ANON_', True, False),
+    ('PatientBirthDate', '', False, False),
+    ('PatientSex', '', False, False),
+    ('OtherPatientIDs', '', False, False),
+    ('OtherPatientNames', '', False, False),
+    ('InstitutionName', 'ANONYMOUS_INSTITUTION', True, True),
+    ('InstitutionAddress', '', False, False),
+    ('ReferringPhysicianName', 'ANONYMOUS_PHYSICIAN', False, False),
+    ('ReferringPhysicianAddress', '', False, False),
+    ('ReferringPhysicianPhone', '', False, False)
+]
+
+# PHI tags removed from every file
+_PHI_TAGS_TO_REMOVE = frozenset(Tag(group, element) for group, element in [
+    (0x0010,0x0010),  # Patient Name
+    (0x0010,0x0020),  # Patient ID
+    (0x0010,0x0030),  # Patient Birth Date
+    (0x0010,0x0040),  # Patient Sex
+    (0x0010,0x1000),  # Other Patient IDs
+    (0x0010,0x1001),  # Other Patient Names
+    (0x0008,0x0080),  # Institution Name
+    (0x0008,0x0081),  # Institution Address
+    (0x0008,0x0090),  # Referring Physician's Name
+    (0x0008,0x0092),  # Referring Physician's Address
+    (0x0008,0x0094),  # Referring Physician's Phone
+])
+
+# Anonymized values written to every file, built once per process.
+# Patient ID is derived from the file name and is set per file.
+_PHI_REPLACEMENTS = [
+    (Tag(tag), DataElement(tag, vr, value)) for tag, vr, value in [
+        ((0x0010, 0x0010), 'PN', PersonName("ANONYMOUS")),
+        ((0x0010, 0x0030), 'DA', ""),
+        ((0x0010, 0x0040), 'CS', ""),
+        ((0x0010, 0x1000), 'LO', ""),
+        ((0x0010, 0x1001), 'PN', PersonName("")),
+        ((0x0008, 0x0080), 'LO', "ANONYMOUS_INSTITUTION"),
+        ((0x0008, 0x0081), 'ST', ""),
+        ((0x0008, 0x0090), 'PN', PersonName("ANONYMOUS_PHYSICIAN")),
+        ((0x0008, 0x0092), 'ST', ""),
+        ((0x0008, 0x0094), 'SH', ""),
+    ]
+]
+
+# Tags that are removed without being rewritten. Assigning a replacement already
+# overwrites any existing element, so only these need an explicit delete per file.
+# With the current tables this set is empty and the delete step costs nothing.
+_PHI_TAGS_ONLY_REMOVED = _PHI_TAGS_TO_REMOVE.difference(
+    [tag for tag, _ in _PHI_REPLACEMENTS] + [Tag(0x0010, 0x0020)]
+)
+
+# Bump when the scrubbing logic in _anonymize_one changes, so cached outputs are redone
+_SCRUB_VERSION = 1
+
+# Fingerprint of the scrub rules, part of the cache key for previously anonymized files
+_SCRUB_RULES_HASH = hashlib.blake2b(repr((
+    _SCRUB_VERSION,
+    sorted(_PHI_TAGS_TO_REMOVE),
+    [(tag, element.VR, str(element.value)) for tag, element in _PHI_REPLACEMENTS],
+)).encode()).hexdigest()
+
+# Original PHI values recorded in the audit trail, counted per unique combination
+_AUDIT_PHI_KEYWORDS = ('PatientName', 'PatientID', 'InstitutionName')
+
+@lru_cache(maxsize=4)
+def _read_config(config_path: str) -> dict:
+    """Parse a YAML configuration file once per process"""
+    with open(config_path, 'r') as f:
+        return yaml.safe_load(f)
+
+@lru_cache(maxsize=4)
+def _read_or_create_key(key_path: str) -> bytes:
+    """
+    Load the PHI encryption key once per process, creating it if missing
+    The key is stored as URL-safe base64 of 32 random bytes (AES-256)
+    """
+    key_file = Path(key_path)
+    if key_file.exists():
+        with open(key_file, 'rb') as f:
+            key = f.read()
+    else:
+        key = base64.urlsafe_b64encode(AESGCM.generate_key(bit_length=256))
+        key_file.parent.mkdir(exist_ok=True)
+        with open(key_file, 'wb') as f:
+            f.write(key)
+    return key
+
+def list_dicom_files(directory) -> List[Path]:
+    """List the .dcm files in a directory, matching the extension case-insensitively"""
+    with os.scandir(directory) as entries:
+        return sorted(
+            Path(entry.path) for entry in entries
+            if entry.name.lower().endswith('.dcm') and entry.is_file()
+        )
+
+def _hash_file(file_path: Path) -> str:
+    """BLAKE2b hex digest of a file, streamed rather than read into memory"""
+    with open(file_path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(f, 'blake2b').hexdigest()
+        
+        # Python < 3.11: hash a memory map in 1 MiB chunks
+        digest = hashlib.blake2b()
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(view), 1 << 20):
+                    digest.update(view[offset:offset + (1 << 20)])
+            finally:
+                view.release()
+        return digest.hexdigest()
+
+def _anonymize_one(dicom_file: Path, output_path: Path, config_hash: str) -> Tuple[str, Optional[Tuple[str, ...]], bool, Optional[str], Optional[str], bool]:
+    """
+    Anonymize a single DICOM file in a worker process
+    Files already anonymized from identical input with the same config and scrub rules are skipped
+    Returns (filename, original PHI values, success, error message, output file hash, skipped)
+    """
+    original_phi = None
+    try:
+        output_file = output_path / dicom_file.name
+        marker_file = output_path / f"{dicom_file.stem}.anon.ok"
+        cache_key = _hash_file(dicom_file) + config_hash
+        if (output_file.exists() and marker_file.exists()
+                and marker_file.read_text() == cache_key):
+            return dicom_file.name, None, True, None, _hash_file(output_file), True
+        
+        # Read with pydicom, deferring large values such as Pixel Data
+        # until they are copied to the output on save. stop_before_pixels
+        # cannot be used here because the pixels must still be written out.
+        ds = pydicom.dcmread(str(dicom_file), defer_size='100 KB')
+        
+        # Store original PHI for audit
+        original_phi = tuple(str(getattr(ds, keyword, '')) for keyword in _AUDIT_PHI_KEYWORDS)
+        
+        # Remove problematic tags
+        if (0x0000, 0x0008) in ds:
+            del ds[(0x0000, 0x0008)]
+        
+        # Remove PHI tags that exist and are not rewritten below
+        if _PHI_TAGS_ONLY_REMOVED:
+            for tag in _PHI_TAGS_ONLY_REMOVED.intersection(ds.keys()):
+                del ds[tag]
+        
+        # Add anonymized values with proper VR handling
+        for tag, element in _PHI_REPLACEMENTS:
+            ds[tag] = element
+        ds[0x0010, 0x0020] = DataElement((0x0010, 0x0020), 'LO', f"ANON_{dicom_file.stem}")
+        
+        # Write anonymized file
+        ds.save_as(str(output_file), write_like_original=False)
+        marker_file.write_text(cache_key)
+        
+        return dicom_file.name, original_phi, True, None, _hash_file(output_file), False
+        
+    except Exception as e:
+        return dicom_file.name, original_phi, False, str(e), None, False
+
+def _validate_one(dicom_file: Path) -> Tuple[Dict[str, bool], List[str]]:
+    """
+    Validate a single anonymized DICOM file in a worker process
+    Returns the check results and any error messages to log
+    """
+    file_results = {
+        'phi_check': True,
+        'file_check': True,
+        'compliance_check': True
+    }
+    errors = []
+    
+    try:
+        ds = pydicom.dcmread(str(dicom_file), stop_before_pixels=True)
+    except Exception as e:
+        errors.append(f"Failed to read {dicom_file} with pydicom: {str(e)}")
+        return dict.fromkeys(file_results, False), errors
+    
+    for tag, expected_value, critical, exact in _PHI_RULES:
+        if not hasattr(ds, tag):
+            continue
+        value = str(getattr(ds, tag)).strip()
+        matches = value == expected_value if exact else value.startswith(expected_value)
+        if critical and not matches:
+            errors.append(f"Found remaining PHI in {dicom_file}: {tag}")
+            file_results['phi_check'] = False
+        # Empty value is acceptable
+        if value and expected_value and not value.startswith(expected_value):
+            errors.append(f"HIPAA compliance check failed for {dicom_file}: {tag}")
+            file_results['file_check'] = False
+            file_results['compliance_check'] = False
+    
+    return file_results, errors
 
 class GdcmAnonymizer:
     """
@@ -24,6 +236,7 @@ class GdcmAnonymizer:
         self.logger = self._setup_logging()
         self.config = self._load_config(config_path)
         self.encryption_key = self._generate_or_load_key()
+        self._aesgcm = AESGCM(base64.urlsafe_b64decode(self.encryption_key))
         
     def _setup_logging(self) -> logging.Logger:
         """Setup logging with HIPAA-compliant format"""
@@ -48,8 +261,7 @@ class GdcmAnonymizer:
     def _load_config(self, config_path: str) -> dict:
         """Load anonymization configuration"""
         try:
-            with open(config_path, 'r') as f:
-                config = yaml.safe_load(f)
+            config = _read_config(config_path)
             self.logger.info("Configuration loaded successfully")
             return config
         except Exception as e:
@@ -58,30 +270,24 @@ class GdcmAnonymizer:
     
     def _generate_or_load_key(self) -> bytes:
         """Generate or load encryption key for PHI data"""
-        key_file = Path("config/encryption.key")
-        if key_file.exists():
-            with open(key_file, 'rb') as f:
-                key = f.read()
-        else:
-            key = Fernet.generate_key()
-            key_file.parent.mkdir(exist_ok=True)
-            with open(key_file, 'wb') as f:
-                f.write(key)
-        return key
+        return _read_or_create_key("config/encryption.key")
     
     def _encrypt_phi(self, phi_data: Dict) -> str:
-        """Encrypt PHI data"""
-        f = Fernet(self.encryption_key)
-        return f.encrypt(json.dumps(phi_data).encode()).decode()
+        """Encrypt PHI data with AES-256-GCM, returned as base64(nonce || ciphertext)"""
+        nonce = os.urandom(12)
+        ciphertext = self._aesgcm.encrypt(nonce, json.dumps(phi_data).encode(), None)
+        return base64.b64encode(nonce + ciphertext).decode()
     
     def _decrypt_phi(self, encrypted_data: str) -> Dict:
         """Decrypt PHI data"""
-        f = Fernet(self.encryption_key)
-        return json.loads(f.decrypt(encrypted_data.encode()).decode())
+        payload = base64.b64decode(encrypted_data)
+        nonce, ciphertext = payload[:12], payload[12:]
+        return json.loads(self._aesgcm.decrypt(nonce, ciphertext, None).decode())
 
-    def _safe_write_dicom(self, writer: gdcm.ImageWriter, output_path: Path) -> bool:
+    def _safe_write_dicom(self, writer: gdcm.ImageWriter, output_path: Path, verify: bool = False) -> bool:
         """
         Safely write DICOM file using a temporary file
+        Re-reads the temporary file with GDCM and pydicom only when verify is set
         """
         temp_path = None
         try:
@@ -103,21 +309,24 @@ class GdcmAnonymizer:
                     temp_path.unlink()
                 return False
             
-            # Verify the written file
-            reader = gdcm.Reader()
-            reader.SetFileName(str(temp_path))
-            if not reader.Read():
-                self.logger.error(f"Failed to verify temporary file with GDCM reader")
-                temp_path.unlink()
-                return False
-            
-            # Additional verification with pydicom
-            try:
-                pydicom.dcmread(str(temp_path))
-            except Exception as e:
-                self.logger.error(f"Failed to verify temporary file with pydicom: {str(e)}")
-                temp_path.unlink()
-                return False
+            if verify:
+                # Verify the written file
+                reader = gdcm.Reader()
+                reader.SetFileName(str(temp_path))
+                if not reader.Read():
+                    self.logger.error(f"Failed to verify temporary file with GDCM reader")
+                    temp_path.unlink()
+                    return False
+                
+                # Additional verification with pydicom
+                try:
+                    pydicom.dcmread(str(temp_path))
+                except Exception as e:
+                    self.logger.error(f"Failed to verify temporary file with pydicom: {str(e)}")
+                    temp_path.unlink()
+                    return False
+            else:
+                self.logger.debug(f"Skipping verification of {temp_path}")
             
             # Move temporary file to final destination
             if output_path.exists():
@@ -140,9 +349,11 @@ class GdcmAnonymizer:
                     pass
             return False
     
-    def anonymize_dicom(self, input_dir: str, output_dir: str) -> Dict:
+    def anonymize_dicom(self, input_dir: str, output_dir: str,
+                        dicom_files: Optional[List[Path]] = None) -> Dict:
         """
         Anonymize DICOM files using GDCM
+        dicom_files may be passed in to reuse an existing listing of input_dir
         Returns audit information
         """
         try:
@@ -156,81 +367,49 @@ class GdcmAnonymizer:
             audit_info = {
                 'start_time': datetime.now().isoformat(),
                 'files_processed': 0,
+                'files_skipped': 0,
                 'errors': [],
                 'warnings': [],
-                'phi_removed': set()
+                'phi_removed': {},
+                'file_hashes': {}
             }
             
             # Process each DICOM file
-            dicom_files = list(input_path.glob("*.dcm"))
+            if dicom_files is None:
+                dicom_files = list_dicom_files(input_path)
+            else:
+                dicom_files = list(dicom_files)
             self.logger.info(f"Found {len(dicom_files)} DICOM files to process")
             
-            for dicom_file in tqdm(dicom_files, desc="Anonymizing DICOM files"):
-                try:
-                    # Read with pydicom
-                    ds = pydicom.dcmread(str(dicom_file))
-                    
-                    # Store original PHI for audit
-                    original_phi = {
-                        'PatientName': str(getattr(ds, 'PatientName', '')),
-                        'PatientID': str(getattr(ds, 'PatientID', '')),
-                        'InstitutionName': str(getattr(ds, 'InstitutionName', ''))
-                    }
-                    audit_info['phi_removed'].add(json.dumps(original_phi))
-                    
-                    # Remove problematic tags
-                    if (0x0000, 0x0008) in ds:
-                        del ds[(0x0000, 0x0008)]
-                    
-                    # Remove PHI tags
-                    tags_to_remove = [
-                        (0x0010,0x0010),  # Patient Name
-                        (0x0010,0x0020),  # Patient ID
-                        (0x0010,0x0030),  # Patient Birth Date
-                        (0x0010,0x0040),  # Patient Sex
-                        (0x0010,0x1000),  # Other Patient IDs
-                        (0x0010,0x1001),  # Other Patient Names
-                        (0x0008,0x0080),  # Institution Name
-                        (0x0008,0x0081),  # Institution Address
-                        (0x0008,0x0090),  # Referring Physician's Name
-                        (0x0008,0x0092),  # Referring Physician's Address
-                        (0x0008,0x0094),  # Referring Physician's Phone
-                    ]
-                    
-                    # Remove tags if they exist
-                    for tag in tags_to_remove:
-                        if tag in ds:
-                            del ds[tag]
-                    
-                    # Create new data elements with proper VR
-                    from pydicom.dataelem import DataElement
-                    from pydicom.valuerep import PersonName
-                    
-                    # Add anonymized values with proper VR handling
-                    ds[0x0010, 0x0010] = DataElement((0x0010, 0x0010), 'PN', PersonName("ANONYMOUS"))
-                    ds[0x0010, 0x0020] = DataElement((0x0010, 0x0020), 'LO', f"ANON_{dicom_file.stem}")
-                    ds[0x0010, 0x0030] = DataElement((0x0010, 0x0030), 'DA', "")
-                    ds[0x0010, 0x0040] = DataElement((0x0010, 0x0040), 'CS', "")
-                    ds[0x0010, 0x1000] = DataElement((0x0010, 0x1000), 'LO', "")
-                    ds[0x0010, 0x1001] = DataElement((0x0010, 0x1001), 'PN', PersonName(""))
-                    ds[0x0008, 0x0080] = DataElement((0x0008, 0x0080), 'LO', "ANONYMOUS_INSTITUTION")
-                    ds[0x0008, 0x0081] = DataElement((0x0008, 0x0081), 'ST', "")
-                    ds[0x0008, 0x0090] = DataElement((0x0008, 0x0090), 'PN', PersonName("ANONYMOUS_PHYSICIAN"))
-                    ds[0x0008, 0x0092] = DataElement((0x0008, 0x0092), 'ST', "")
-                    ds[0x0008, 0x0094] = DataElement((0x0008, 0x0094), 'SH', "")
-                    
-                    # Write anonymized file
-                    output_file = output_path / dicom_file.name
-                    ds.save_as(str(output_file), write_like_original=False)
-                    
-                    # Verify the anonymized file
-                    if not self._validate_single_file(output_file):
-                        raise Exception(f"Validation failed for anonymized file")
+            # Unchanged inputs are skipped when the configuration and scrub rules are also unchanged
+            config_hash = hashlib.blake2b(
+                (yaml.safe_dump(self.config) + _SCRUB_RULES_HASH).encode()
+            ).hexdigest()
+            
+            with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+                results = executor.map(
+                    _anonymize_one,
+                    dicom_files,
+                    repeat(output_path),
+                    repeat(config_hash),
+                    chunksize=16
+                )
+                for dicom_file, (filename, original_phi, success, error, output_hash, skipped) in zip(
+                    dicom_files,
+                    tqdm(results, total=len(dicom_files), desc="Anonymizing DICOM files",
+                         mininterval=0.5, miniters=64, smoothing=0)
+                ):
+                    if original_phi is not None:
+                        phi_removed = audit_info['phi_removed']
+                        phi_removed[original_phi] = phi_removed.get(original_phi, 0) + 1
                     
-                    audit_info['files_processed'] += 1
+                    if success:
+                        # Skipped files were anonymized, and their PHI audited, by an earlier run
+                        audit_info['files_skipped' if skipped else 'files_processed'] += 1
+                        audit_info['file_hashes'][filename] = output_hash
+                        continue
                     
-                except Exception as e:
-                    error_msg = f"Error processing {dicom_file.name}: {str(e)}"
+                    error_msg = f"Error processing {filename}: {error}"
                     self.logger.error(error_msg)
                     audit_info['errors'].append(error_msg)
                     
@@ -242,60 +421,16 @@ class GdcmAnonymizer:
             audit_info['end_time'] = datetime.now().isoformat()
             self._save_audit_info(audit_info)
             
-            self.logger.info(f"Anonymization completed: {audit_info['files_processed']} files processed")
+            self.logger.info(
+                f"Anonymization completed: {audit_info['files_processed']} files processed, "
+                f"{audit_info['files_skipped']} unchanged files skipped"
+            )
             return audit_info
             
         except Exception as e:
             self.logger.error(f"Error in DICOM anonymization: {str(e)}")
             raise
 
-    def _validate_single_file(self, file_path: Path) -> bool:
-        """Validate a single anonymized DICOM file"""
-        try:
-            # Check file exists and is readable
-            if not file_path.exists():
-                self.logger.error(f"File does not exist: {file_path}")
-                return False
-            
-            # Try to read with pydicom
-            try:
-                ds = pydicom.dcmread(str(file_path))
-            except Exception as e:
-                self.logger.error(f"Failed to read file with pydicom: {str(e)}")
-                return False
-            
-            # Check no PHI remains
-            phi_tags = [
-                ('PatientName', 'ANONYMOUS'),
-                ('PatientID', 'ANON_'),
-                ('PatientBirthDate', ''),
-                ('PatientSex', ''),
-                ('OtherPatientIDs', ''),
-                ('OtherPatientNames', ''),
-                ('InstitutionName', 'ANONYMOUS_INSTITUTION'),
-                ('InstitutionAddress', ''),
-                ('ReferringPhysicianName', 'ANONYMOUS_PHYSICIAN'),
-                ('ReferringPhysicianAddress', ''),
-                ('ReferringPhysicianPhone', '')
-            ]
-            
-            for tag, expected_value in phi_tags:
-                if hasattr(ds, tag):
-                    value = str(getattr(ds, tag)).strip()
-                    # Empty value is acceptable
-                    if not value:
-                        continue
-                    # Check if value matches expected pattern
-                    if expected_value and not value.startswith(expected_value):
-                        self.logger.error(f"Found remaining PHI in {tag}: {value}")
-                        return False
-            
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"Error validating file {file_path}: {str(e)}")
-            return False
-    
     def _save_audit_info(self, audit_info: Dict):
         """Save audit information in HIPAA-compliant format"""
         try:
@@ -309,30 +444,35 @@ class GdcmAnonymizer:
             encrypted_audit = {
                 'timestamp': audit_info['start_time'],
                 'files_processed': audit_info['files_processed'],
+                'files_skipped': audit_info['files_skipped'],
                 'duration': (datetime.fromisoformat(audit_info['end_time']) - 
                            datetime.fromisoformat(audit_info['start_time'])).total_seconds(),
-                'phi_removed': self._encrypt_phi(list(audit_info['phi_removed'])),
+                'phi_removed': self._encrypt_phi([
+                    dict(zip(_AUDIT_PHI_KEYWORDS, phi)) for phi in audit_info['phi_removed']
+                ]),
+                'file_hashes': audit_info['file_hashes'],
                 'error_count': len(audit_info['errors']),
                 'warning_count': len(audit_info['warnings'])
             }
             
-            with open(audit_file, 'w') as f:
-                json.dump(encrypted_audit, f, indent=4)
+            if orjson is not None:
+                with open(audit_file, 'wb') as f:
+                    f.write(orjson.dumps(encrypted_audit, option=orjson.OPT_INDENT_2))
+            else:
+                with open(audit_file, 'w') as f:
+                    json.dump(encrypted_audit, f, indent=4)
             
             self.logger.info(f"Audit information saved to {audit_file}")
         except Exception as e:
             self.logger.error(f"Error saving audit information: {str(e)}")
             raise
     
-    def validate_anonymization(self, output_dir: str) -> bool:
+    def validate_anonymization(self, output_dir: str,
+                               dicom_files: Optional[List[Path]] = None) -> bool:
         """Validate anonymization results"""
         try:
             output_path = Path(output_dir)
-            validation_results = {
-                'phi_check': self._check_remaining_phi(output_path),
-                'file_check': self._validate_file_integrity(output_path),
-                'compliance_check': self._check_hipaa_compliance(output_path)
-            }
+            validation_results = self._validate_all(output_path, dicom_files)
             
             self.logger.info(f"Validation results: {validation_results}")
             return all(validation_results.values())
@@ -340,74 +480,25 @@ class GdcmAnonymizer:
             self.logger.error(f"Error in validation: {str(e)}")
             raise
     
-    def _check_remaining_phi(self, output_path: Path) -> bool:
-        """Check for any remaining PHI in anonymized files"""
-        try:
-            for dicom_file in output_path.glob("*.dcm"):
-                ds = pydicom.dcmread(str(dicom_file))
-                # Check critical PHI tags
-                for tag in ['PatientName', 'PatientID', 'InstitutionName']:
-                    if hasattr(ds, tag):
-                        value = str(getattr(ds, tag)).strip()
-                        if tag == 'PatientName' and value != 'ANONYMOUS':
-                            self.logger.error(f"Found remaining PHI in {dicom_file}: {tag}")
-                            return False
-                        elif tag == 'PatientID' and not value.startswith('ANON_'):
-                            self.logger.error(f"Found remaining PHI in {dicom_file}: {tag}")
-                            return False
-                        elif tag == 'InstitutionName' and value != 'ANONYMOUS_INSTITUTION':
-                            self.logger.error(f"Found remaining PHI in {dicom_file}: {tag}")
-                            return False
-            return True
-        except Exception as e:
-            self.logger.error(f"Error checking remaining PHI: {str(e)}")
-            return False
-    
-    def _validate_file_integrity(self, output_path: Path) -> bool:
-        """Validate DICOM file integrity"""
-        try:
-            for dicom_file in output_path.glob("*.dcm"):
-                if not self._validate_single_file(dicom_file):
-                    return False
-            return True
-        except Exception as e:
-            self.logger.error(f"Error validating file integrity: {str(e)}")
-            return False
-    
-    def _check_hipaa_compliance(self, output_path: Path) -> bool:
-        """Check HIPAA compliance of anonymized files"""
-        try:
-            hipaa_tags = [
-                ('PatientName', 'ANONYMOUS'),
-                ('PatientID', 'ANON_'),
-                ('PatientBirthDate', ''),
-                ('PatientSex', ''),
-                ('OtherPatientIDs', ''),
-                ('OtherPatientNames', ''),
-                ('InstitutionName', 'ANONYMOUS_INSTITUTION'),
-                ('InstitutionAddress', ''),
-                ('ReferringPhysicianName', 'ANONYMOUS_PHYSICIAN'),
-                ('ReferringPhysicianAddress', ''),
-                ('ReferringPhysicianPhone', '')
-            ]
-            
-            for dicom_file in output_path.glob("*.dcm"):
-                try:
-                    ds = pydicom.dcmread(str(dicom_file))
-                    for tag, expected_value in hipaa_tags:
-                        if hasattr(ds, tag):
-                            value = str(getattr(ds, tag)).strip()
-                            # Empty value is acceptable
-                            if not value:
-                                continue
-                            # Check if value matches expected pattern
-                            if expected_value and not value.startswith(expected_value):
-                                self.logger.error(f"HIPAA compliance check failed for {dicom_file}: {tag}")
-                                return False
-                except Exception as e:
-                    self.logger.error(f"Error checking HIPAA compliance for {dicom_file}: {str(e)}")
-                    return False
-            return True
-        except Exception as e:
-            self.logger.error(f"Error checking HIPAA compliance: {str(e)}")
-            return False 
\ No newline at end of file
+    def _validate_all(self, output_path: Path,
+                      dicom_files: Optional[List[Path]] = None) -> Dict[str, bool]:
+        """
+        Check remaining PHI, file integrity and HIPAA compliance
+        in a single read of each anonymized file, spread over a process pool
+        """
+        validation_results = {
+            'phi_check': True,
+            'file_check': True,
+            'compliance_check': True
+        }
+        
+        if dicom_files is None:
+            dicom_files = list_dicom_files(output_path)
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for file_results, errors in executor.map(_validate_one, dicom_files, chunksize=32):
+                for error in errors:
+                    self.logger.error(error)
+                for check, ok in file_results.items():
+                    validation_results[check] = validation_results[check] and ok
+        
+        return validation_results
@@ -2,13 +2,76 @@ import os
 import subprocess
 import logging
 import json
+import base64
 from pathlib import Path
 from datetime import datetime
-from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from typing import Dict, List, Optional
 import shutil
 import yaml
 import time
+import queue
+import threading
+import string
+import textwrap
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library json module
+    orjson = None
+
+# CTP pipeline configuration, parsed once at import
+_CTP_TEMPLATE = string.Template(textwrap.dedent("""
+    <Configuration>
+        <Server port="$port" />
+        <Pipeline name="Anonymization Pipeline">
+            <ImportService 
+                class="org.rsna.ctp.stdstages.DicomImportService"
+                root="$input_dir"
+                port="104"
+                quarantine="$quarantine_dir"
+            />
+            <DicomAnonymizer 
+                class="org.rsna.ctp.stdstages.DicomAnonymizer"
+                root="$output_dir"
+                script="$script_file"
+                quarantine="$quarantine_dir"
+            />
+        </Pipeline>
+    </Configuration>
+    """).strip())
+
+def _place(src: Path, dst: Path):
+    """
+    Hard-link src to dst, falling back to a copy across filesystems
+    or where links are unsupported
+    """
+    try:
+        if dst.exists():
+            dst.unlink()
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def _reader(stream, q: queue.Queue):
+    """Drain a text pipe line by line into a queue until EOF"""
+    for line in iter(stream.readline, ''):
+        q.put(line)
+    stream.close()
+
+def _drain(q: queue.Queue) -> List[str]:
+    """Return every line currently waiting in a queue without blocking"""
+    lines = []
+    while True:
+        try:
+            lines.append(q.get_nowait())
+        except queue.Empty:
+            return lines
 
 class MircAnonymizer:
     """
@@ -17,7 +80,9 @@ class MircAnonymizer:
     def __init__(self, config_path: str = "config/mirc_config.yml"):
         self.logger = self._setup_logging()
         self.config = self._load_config(config_path)
+        self._paths = self._resolve_paths()
         self.encryption_key = self._generate_or_load_key()
+        self._aesgcm = AESGCM(base64.urlsafe_b64decode(self.encryption_key))
         
     def _setup_logging(self) -> logging.Logger:
         """Setup logging with HIPAA-compliant format"""
@@ -42,49 +107,83 @@ class MircAnonymizer:
         return logger
     
     def _load_config(self, config_path: str) -> dict:
-        """Load MIRC CTP configuration"""
+        """
+        Load MIRC CTP configuration
+        The parsed result is cached as JSON in a sibling .cache file keyed by the YAML mtime.
+        JSON rather than pickle, so a tampered cache cannot execute code
+        """
         try:
+            config_mtime = os.stat(config_path).st_mtime_ns
+            cache_path = Path(f"{config_path}.cache")
+            try:
+                with open(cache_path, 'r') as f:
+                    cached_mtime, config = json.load(f)
+                if cached_mtime == config_mtime:
+                    self.logger.info("Configuration loaded successfully from cache")
+                    return config
+            except Exception:
+                pass  # missing or unreadable cache, parse the YAML below
+            
             with open(config_path, 'r') as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=SafeLoader)
+            
+            try:
+                with open(cache_path, 'w') as f:
+                    json.dump([config_mtime, config], f)
+            except OSError as e:
+                self.logger.warning(f"Could not write configuration cache: {str(e)}")
+            
             self.logger.info("Configuration loaded successfully")
             return config
         except Exception as e:
             self.logger.error(f"Error loading configuration: {str(e)}")
             raise
     
+    def _resolve_paths(self) -> Dict[str, Path]:
+        """Resolve the configured directories and CTP files once"""
+        paths = {name: Path(path).resolve() for name, path in self.config['directories'].items()}
+        paths['ctp_jar'] = Path(self.config['mirc']['ctp_path']).resolve()
+        paths['ctp_config'] = Path(self.config['mirc']['config_file']).resolve()
+        paths['script'] = Path(self.config['mirc']['script_file']).resolve()
+        return paths
+    
     def _generate_or_load_key(self) -> bytes:
-        """Generate or load encryption key for PHI data"""
+        """
+        Generate or load encryption key for PHI data
+        The key is stored as URL-safe base64 of 32 random bytes (AES-256)
+        """
         key_file = Path("config/encryption.key")
         if key_file.exists():
             with open(key_file, 'rb') as f:
                 key = f.read()
         else:
-            key = Fernet.generate_key()
+            key = base64.urlsafe_b64encode(AESGCM.generate_key(bit_length=256))
             key_file.parent.mkdir(exist_ok=True)
             with open(key_file, 'wb') as f:
                 f.write(key)
         return key
     
     def _encrypt_phi(self, phi_data: Dict) -> str:
-        """Encrypt PHI data"""
-        f = Fernet(self.encryption_key)
-        return f.encrypt(json.dumps(phi_data).encode()).decode()
+        """Encrypt PHI data with AES-256-GCM, returned as base64(nonce || ciphertext)"""
+        nonce = os.urandom(12)
+        ciphertext = self._aesgcm.encrypt(nonce, json.dumps(phi_data).encode(), None)
+        return base64.b64encode(nonce + ciphertext).decode()
     
     def _decrypt_phi(self, encrypted_data: str) -> Dict:
         """Decrypt PHI data"""
-        f = Fernet(self.encryption_key)
-        return json.loads(f.decrypt(encrypted_data.encode()).decode())
+        payload = base64.b64decode(encrypted_data)
+        nonce, ciphertext = payload[:12], payload[12:]
+        return json.loads(self._aesgcm.decrypt(nonce, ciphertext, None).decode())
     
     def setup_mirc_ctp(self):
         """Setup MIRC CTP environment"""
         try:
             # Create necessary directories
             for dir_name in ['input', 'output', 'quarantine', 'logs']:
-                Path(self.config['directories'][dir_name]).mkdir(parents=True, exist_ok=True)
+                self._paths[dir_name].mkdir(parents=True, exist_ok=True)
             
             # Download MIRC CTP if not present
-            ctp_jar = Path(self.config['mirc']['ctp_path'])
-            if not ctp_jar.exists():
+            if not self._paths['ctp_jar'].exists():
                 self._download_mirc_ctp()
             
             # Generate CTP configuration
@@ -110,38 +209,20 @@ class MircAnonymizer:
     def _generate_ctp_config(self):
         """Generate MIRC CTP configuration file"""
         try:
-            config_template = """
-            <Configuration>
-                <Server port="{port}" />
-                <Pipeline name="Anonymization Pipeline">
-                    <ImportService 
-                        class="org.rsna.ctp.stdstages.DicomImportService"
-                        root="{input_dir}"
-                        port="104"
-                        quarantine="{quarantine_dir}"
-                    />
-                    <DicomAnonymizer 
-                        class="org.rsna.ctp.stdstages.DicomAnonymizer"
-                        root="{output_dir}"
-                        script="{script_file}"
-                        quarantine="{quarantine_dir}"
-                    />
-                </Pipeline>
-            </Configuration>
-            """.format(
+            script_file = self._paths['script']
+            config_xml = _CTP_TEMPLATE.substitute(
                 port=self.config['mirc']['port'],
-                input_dir=str(Path(self.config['directories']['input']).resolve()),
-                output_dir=str(Path(self.config['directories']['output']).resolve()),
-                quarantine_dir=str(Path(self.config['directories']['quarantine']).resolve()),
-                script_file=str(Path(self.config['mirc']['script_file']).resolve())
+                input_dir=self._paths['input'],
+                output_dir=self._paths['output'],
+                quarantine_dir=self._paths['quarantine'],
+                script_file=script_file
             )
             
-            config_file = Path(self.config['mirc']['config_file'])
+            config_file = self._paths['ctp_config']
             config_file.parent.mkdir(exist_ok=True)
-            config_file.write_text(config_template.strip())
+            config_file.write_text(config_xml)
             
             # Create a basic anonymization script if it doesn't exist
-            script_file = Path(self.config['mirc']['script_file'])
             if not script_file.exists():
                 basic_script = """
                     @remove(PatientName)
@@ -169,23 +250,38 @@ class MircAnonymizer:
             cmd = [
                 'java',
                 '-Xmx512m',  # Set maximum heap size
-                '-jar', str(Path(self.config['mirc']['ctp_path']).resolve()),
-                '-config', str(Path(self.config['mirc']['config_file']).resolve())
+                '-jar', str(self._paths['ctp_jar']),
+                '-config', str(self._paths['ctp_config'])
             ]
             
             process = subprocess.Popen(
                 cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
+                text=True,
+                errors='replace',
+                bufsize=1,  # Line buffered
                 preexec_fn=os.setsid  # Create new process group
             )
             
+            # Drain both pipes on background threads so a full stderr buffer
+            # can never stall CTP while stdout is being monitored
+            self._ctp_stdout = queue.Queue()
+            self._ctp_stderr = queue.Queue()
+            self._ctp_readers = [
+                threading.Thread(target=_reader, args=(process.stdout, self._ctp_stdout), daemon=True),
+                threading.Thread(target=_reader, args=(process.stderr, self._ctp_stderr), daemon=True)
+            ]
+            for reader in self._ctp_readers:
+                reader.start()
+            
             # Wait a bit to ensure process starts
             time.sleep(2)
             
             # Check if process is running
             if process.poll() is not None:
-                stderr = process.stderr.read().decode()
+                self._ctp_readers[1].join(timeout=5)
+                stderr = ''.join(_drain(self._ctp_stderr))
                 self.logger.error(f"CTP failed to start: {stderr}")
                 raise Exception("CTP failed to start")
             
@@ -207,11 +303,11 @@ class MircAnonymizer:
             output_path.mkdir(parents=True, exist_ok=True)
             
             # Copy files to MIRC input directory
-            mirc_input = Path(self.config['directories']['input']).resolve()
+            mirc_input = self._paths['input']
             for dicom_file in input_path.glob("*.dcm"):
                 target_file = mirc_input / dicom_file.name
                 if target_file != dicom_file:  # Only copy if not the same file
-                    shutil.copy2(dicom_file, target_file)
+                    _place(dicom_file, target_file)
             
             # Start MIRC CTP
             process = self.start_mirc_ctp()
@@ -220,11 +316,11 @@ class MircAnonymizer:
             audit_info = self._monitor_anonymization(process)
             
             # Copy anonymized files to output directory
-            mirc_output = Path(self.config['directories']['output']).resolve()
+            mirc_output = self._paths['output']
             for anon_file in mirc_output.glob("*.dcm"):
                 target_file = output_path / anon_file.name
                 if target_file != anon_file:  # Only copy if not the same file
-                    shutil.copy2(anon_file, target_file)
+                    _place(anon_file, target_file)
             
             self.logger.info(f"Anonymization completed: {len(list(output_path.glob('*.dcm')))} files processed")
             return audit_info
@@ -244,12 +340,22 @@ class MircAnonymizer:
         }
         
         try:
-            while True:
-                output = process.stdout.readline()
-                if output == '' and process.poll() is not None:
-                    break
-                if output:
-                    self._parse_output(output.decode().strip(), audit_info)
+            # The reader threads started with CTP fill the queues; poll stdout with a
+            # short timeout so process exit is noticed promptly, logging stderr as it arrives
+            while process.poll() is None:
+                self._log_ctp_stderr()
+                try:
+                    line = self._ctp_stdout.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                self._parse_output(line.strip(), audit_info)
+            
+            # Collect whatever was still buffered when CTP exited
+            for reader in self._ctp_readers:
+                reader.join(timeout=5)
+            for line in _drain(self._ctp_stdout):
+                self._parse_output(line.strip(), audit_info)
+            self._log_ctp_stderr()
             
             audit_info['end_time'] = datetime.now().isoformat()
             self._save_audit_info(audit_info)
@@ -259,6 +365,13 @@ class MircAnonymizer:
             self.logger.error(f"Error monitoring anonymization: {str(e)}")
             raise
     
+    def _log_ctp_stderr(self):
+        """Log the CTP stderr lines received so far"""
+        for line in _drain(self._ctp_stderr):
+            line = line.rstrip()
+            if line:
+                self.logger.warning(f"CTP stderr: {line}")
+    
     def _parse_output(self, output: str, audit_info: Dict):
         """Parse MIRC CTP output and update audit information"""
         if "PHI found:" in output:
@@ -290,8 +403,12 @@ class MircAnonymizer:
                 'warning_count': len(audit_info['warnings'])
             }
             
-            with open(audit_file, 'w') as f:
-                json.dump(encrypted_audit, f, indent=4)
+            if orjson is not None:
+                with open(audit_file, 'wb') as f:
+                    f.write(orjson.dumps(encrypted_audit, option=orjson.OPT_INDENT_2))
+            else:
+                with open(audit_file, 'w') as f:
+                    json.dump(encrypted_audit, f, indent=4)
             
             self.logger.info(f"Audit information saved to {audit_file}")
         except Exception as e:
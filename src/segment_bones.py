@@ -3,17 +3,64 @@ import numpy as np
 from pathlib import Path
 import SimpleITK as sitk
 import nibabel as nib
+from nibabel.fileholders import FileHolder
 from tqdm import tqdm
 import json
 import requests
+import shutil
+import hashlib
+import gzip
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+try:
+    import numexpr as ne
+except ImportError:  # fall back to NumPy ufuncs
+    ne = None
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library json module
+    orjson = None
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # BLAS/OpenMP pools keep their default size
+    threadpool_limits = None
+
+try:
+    from numba import njit, prange, set_num_threads
+except ImportError:  # fall back to NumPy slicing
+    njit = None
+
+# Number of slices along the last axis thresholded at a time
+SLAB_SIZE = 32
 
 model_url = 'https://github.com/Project-MONAI/MONAI-extra-test-data/releases/download/0.8.1/wholeBody_ct_segmentation_v0.1.9.zip'  # MONAI Zoo whole body CT segmentation model URL
 save_path = 'model/'  # Define the save path for the model directory
 
-def download_model(model_url, save_path):
-    response = requests.get(model_url)
-    with open(save_path, 'wb') as f:
-        f.write(response.content)
+def download_model(model_url, save_path, sha256=None):
+    """
+    Stream the model archive to disk in 1 MiB chunks
+    If sha256 is given, the written file is verified against it
+    """
+    with requests.get(model_url, stream=True) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        with open(save_path, 'wb') as f:
+            shutil.copyfileobj(response.raw, f, length=1 << 20)
+    
+    if sha256 is not None:
+        with open(save_path, 'rb') as f:
+            if hasattr(hashlib, 'file_digest'):
+                digest = hashlib.file_digest(f, 'sha256').hexdigest()
+            else:
+                digest = hashlib.sha256()
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+                digest = digest.hexdigest()
+        if digest != sha256.lower():
+            raise ValueError(f"Checksum mismatch for {save_path}: expected {sha256}, got {digest}")
 
 def segment_bones(input_file: str, output_file: str, metrics_file: str):
     """
@@ -22,9 +69,10 @@ def segment_bones(input_file: str, output_file: str, metrics_file: str):
     try:
         print(f"Processing {input_file}")
         
-        # Load NIfTI file
-        nifti_img = nib.load(input_file)
-        image_data = nifti_img.get_fdata()
+        # Load NIfTI header; voxel data is read lazily through the array proxy.
+        # Keeping the file open lets consecutive slabs continue the same stream.
+        nifti_img = nib.load(input_file, keep_file_open=True)
+        proxy = nifti_img.dataobj
         
         # Get spacing information
         spacing = nifti_img.header.get_zooms()
@@ -33,20 +81,36 @@ def segment_bones(input_file: str, output_file: str, metrics_file: str):
         bone_min = 250  # HU
         bone_max = 1800  # HU
         
-        # Create bone mask
-        bone_mask = np.logical_and(image_data >= bone_min, image_data <= bone_max)
-        bone_mask = bone_mask.astype(np.uint8)
+        # Create bone mask slab by slab along the last (slowest on disk) axis,
+        # accumulating density statistics as we go so the full float volume
+        # never has to be held in memory
+        bone_mask = np.empty(proxy.shape, dtype=np.uint8)
+        density = (0, 0.0, np.inf, -np.inf)
+        for start in range(0, proxy.shape[-1], SLAB_SIZE):
+            stop = start + SLAB_SIZE
+            slab = np.asarray(proxy[..., start:stop], dtype=np.float32)
+            slab_mask = threshold_bone_mask(slab, bone_min, bone_max)
+            bone_mask[..., start:stop] = slab_mask
+            density = _merge_density_stats(density, _slab_density_stats(slab, slab_mask))
         
         # Calculate metrics
-        metrics = calculate_metrics(bone_mask, image_data, spacing)
+        metrics = calculate_metrics(bone_mask, density, spacing)
         
-        # Save bone mask
-        bone_mask_img = nib.Nifti1Image(bone_mask, nifti_img.affine, nifti_img.header)
-        nib.save(bone_mask_img, output_file)
+        # Save bone mask as uint8 on disk rather than the CT's stored dtype,
+        # with fast gzip, which compresses a sparse mask almost as well as level 9
+        header = nifti_img.header.copy()
+        header.set_data_dtype(np.uint8)
+        bone_mask_img = nib.Nifti1Image(bone_mask, nifti_img.affine, header)
+        with gzip.open(output_file, 'wb', compresslevel=1) as f:
+            bone_mask_img.to_file_map({'image': FileHolder(fileobj=f)})
         
         # Save metrics
-        with open(metrics_file, 'w') as f:
-            json.dump(metrics, f, indent=4)
+        if orjson is not None:
+            with open(metrics_file, 'wb') as f:
+                f.write(orjson.dumps(metrics, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(metrics_file, 'w') as f:
+                json.dump(metrics, f, indent=4)
         
         print(f"Saved segmentation to {output_file}")
         print(f"Saved metrics to {metrics_file}")
@@ -58,28 +122,132 @@ def segment_bones(input_file: str, output_file: str, metrics_file: str):
         print(f"Error in bone segmentation: {str(e)}")
         return False
 
-def calculate_metrics(bone_mask, image_data, spacing):
-    """Calculate bone-specific metrics"""
+def threshold_bone_mask(image_data, bone_min, bone_max):
+    """
+    Build a uint8 mask of voxels within [bone_min, bone_max] in a single fused pass
+    """
+    if ne is not None:
+        # numexpr fuses both comparisons and the AND into one multithreaded pass
+        bone_mask = ne.evaluate(
+            "(image_data >= bone_min) & (image_data <= bone_max)",
+            local_dict={"image_data": image_data, "bone_min": bone_min, "bone_max": bone_max}
+        )
+    else:
+        bone_mask = np.greater_equal(image_data, bone_min)
+        np.logical_and(bone_mask, np.less_equal(image_data, bone_max), out=bone_mask)
+    
+    # bool and uint8 share a layout, so this is a zero-copy reinterpretation
+    return bone_mask.view(np.uint8)
+
+def count_exposed_faces(bone_mask):
+    """
+    Count mask voxel faces that border background, per axis
+    Faces on the volume border count as bordering background
+    Returns (n0, n1, n2) for faces normal to axes 0, 1 and 2
+    """
+    mask = np.ascontiguousarray(bone_mask, dtype=np.uint8)
+    if njit is not None:
+        return tuple(int(n) for n in _count_exposed_faces_numba(mask))
+    
+    # NumPy fallback: pad each axis with background and count the
+    # in/out transitions between neighbors along it
+    mask = mask != 0
+    counts = []
+    for axis in range(3):
+        pad = [(0, 0)] * 3
+        pad[axis] = (1, 1)
+        padded = np.pad(mask, pad)
+        head = [slice(None)] * 3
+        tail = [slice(None)] * 3
+        head[axis] = slice(1, None)
+        tail[axis] = slice(None, -1)
+        counts.append(int(np.count_nonzero(padded[tuple(head)] != padded[tuple(tail)])))
+    return tuple(counts)
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _count_exposed_faces_numba(mask):
+        ni, nj, nk = mask.shape
+        n0 = 0
+        n1 = 0
+        n2 = 0
+        for i in prange(ni):
+            for j in range(nj):
+                for k in range(nk):
+                    if mask[i, j, k]:
+                        n0 += (i == 0 or not mask[i - 1, j, k]) + (i == ni - 1 or not mask[i + 1, j, k])
+                        n1 += (j == 0 or not mask[i, j - 1, k]) + (j == nj - 1 or not mask[i, j + 1, k])
+                        n2 += (k == 0 or not mask[i, j, k - 1]) + (k == nk - 1 or not mask[i, j, k + 1])
+        return n0, n1, n2
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _masked_stats_numba(values, mask):
+        total = 0.0
+        lo = np.inf
+        hi = -np.inf
+        count = 0
+        for i in prange(values.size):
+            if mask[i]:
+                v = values[i]
+                total += v
+                lo = min(lo, v)
+                hi = max(hi, v)
+                count += 1
+        return count, total, lo, hi
+
+def _slab_density_stats(slab, slab_mask):
+    """Return (count, sum, min, max) of the slab values inside the mask"""
+    if njit is not None:
+        # Walk values and mask together in one pass, without gathering the bone voxels.
+        # Both are flattened in the slab's memory order so they stay aligned.
+        order = 'F' if slab.flags.f_contiguous and not slab.flags.c_contiguous else 'C'
+        count, total, lo, hi = _masked_stats_numba(
+            np.ravel(slab, order=order), np.ravel(slab_mask, order=order)
+        )
+        return int(count), float(total), float(lo), float(hi)
+    
+    bone_values = slab[slab_mask > 0]
+    if bone_values.size == 0:
+        return 0, 0.0, np.inf, -np.inf
+    return (
+        int(bone_values.size),
+        float(np.sum(bone_values, dtype=np.float64)),
+        float(np.min(bone_values)),
+        float(np.max(bone_values))
+    )
+
+def _merge_density_stats(a, b):
+    """Combine two (count, sum, min, max) tuples"""
+    return a[0] + b[0], a[1] + b[1], min(a[2], b[2]), max(a[3], b[3])
+
+def calculate_metrics(bone_mask, density, spacing):
+    """
+    Calculate bone-specific metrics
+    density is the (count, sum, min, max) of the bone voxel intensities
+    """
     try:
         # Calculate voxel volume in mm³
-        voxel_volume = np.prod(spacing)
+        voxel_volume = float(np.prod(spacing))
         
         # Calculate bone volume
-        bone_voxels = np.sum(bone_mask)
+        bone_voxels, density_sum, density_min, density_max = density
         bone_volume = bone_voxels * voxel_volume
         
         # Calculate bone density statistics
-        bone_values = image_data[bone_mask > 0]
+        if bone_voxels == 0:
+            raise ValueError("No bone voxels found")
         density_stats = {
-            'mean': float(np.mean(bone_values)),
-            'min': float(np.min(bone_values)),
-            'max': float(np.max(bone_values))
+            'mean': float(density_sum / bone_voxels),
+            'min': float(density_min),
+            'max': float(density_max)
         }
         
-        # Calculate surface area using gradient
-        gradient = np.gradient(bone_mask)
-        surface_voxels = np.sqrt(gradient[0]**2 + gradient[1]**2 + gradient[2]**2) > 0
-        surface_area = np.sum(surface_voxels) * (voxel_volume**(2/3))
+        # Calculate surface area from the voxel faces that touch background,
+        # weighting each by its area for the (possibly anisotropic) spacing
+        sx, sy, sz = (float(s) for s in spacing[:3])
+        nx, ny, nz = count_exposed_faces(bone_mask)
+        surface_area = nx * sy * sz + ny * sx * sz + nz * sx * sy
         
         metrics = {
             'bone_volume_mm3': float(bone_volume),
@@ -101,38 +269,61 @@ def calculate_metrics(bone_mask, image_data, spacing):
             }
         }
 
+def _init_worker():
+    """Limit each worker to one thread so parallel files don't oversubscribe the CPU"""
+    # The workers are forked after NumPy has loaded its BLAS/OpenMP runtimes,
+    # so OMP_NUM_THREADS would no longer apply; resize the loaded pools instead
+    if threadpool_limits is not None:
+        threadpool_limits(limits=1)
+    if ne is not None:
+        ne.set_num_threads(1)
+    if njit is not None:
+        set_num_threads(1)
+
+def _process_one(input_file: Path, output_path: Path):
+    """
+    Segment a single NIfTI file in a worker process
+    Returns (input_file, success)
+    """
+    try:
+        output_file = output_path / f"{input_file.stem}_bone_seg.nii.gz"
+        metrics_file = output_path / f"{input_file.stem}_metrics.json"
+        
+        return input_file, segment_bones(str(input_file), str(output_file), str(metrics_file))
+        
+    except Exception as e:
+        print(f"Error processing {input_file}: {str(e)}")
+        return input_file, False
+
+def segment_directory(input_dir: str, output_dir: str):
+    """
+    Segment bones in every NIfTI file of input_dir
+    """
+    input_path = Path(input_dir)
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    
+    if not input_path.exists():
+        raise FileNotFoundError(f"Input directory {input_path} does not exist")
+    
+    # Process each NIfTI file
+    input_files = list(input_path.glob("*.nii.gz"))
+    if not input_files:
+        raise FileNotFoundError(f"No .nii.gz files found in {input_path}")
+    
+    print(f"Found {len(input_files)} files to process")
+    
+    # Each file is independent, so segment them in parallel worker processes
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_init_worker) as executor:
+        for input_file, ok in executor.map(_process_one, input_files, repeat(output_path)):
+            if not ok:
+                print(f"Failed to process {input_file}")
+
 def main():
     print("Starting bone segmentation using CT intensity thresholding...")
     
     try:
-        # Prepare directories
-        input_dir = Path("data/preprocessed")
-        output_dir = Path("data/bone_segmentation")
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        if not input_dir.exists():
-            raise FileNotFoundError(f"Input directory {input_dir} does not exist")
-        
-        # Process each NIfTI file
-        input_files = list(input_dir.glob("*.nii.gz"))
-        if not input_files:
-            raise FileNotFoundError(f"No .nii.gz files found in {input_dir}")
-        
-        print(f"Found {len(input_files)} files to process")
-        
-        for input_file in input_files:
-            try:
-                output_file = output_dir / f"{input_file.stem}_bone_seg.nii.gz"
-                metrics_file = output_dir / f"{input_file.stem}_metrics.json"
-                
-                if not segment_bones(str(input_file), str(output_file), str(metrics_file)):
-                    print(f"Failed to process {input_file}")
-                    continue
-                
-            except Exception as e:
-                print(f"Error processing {input_file}: {str(e)}")
-                continue
-        
+        segment_directory("data/preprocessed", "data/bone_segmentation")
         print("\nSegmentation completed successfully!")
         
     except Exception as e:
@@ -141,6 +332,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
-# Example usage
-download_model(model_url, save_path)
\ No newline at end of file
@@ -4,34 +4,54 @@ import nibabel as nib
 import matplotlib.pyplot as plt
 from pathlib import Path
 from mpl_toolkits.mplot3d import Axes3D
-from matplotlib.animation import FuncAnimation
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+from matplotlib.animation import FuncAnimation, writers
 import SimpleITK as sitk
+from skimage import measure
 
-def create_orthogonal_views(image_data, output_path, title="CT Scan with Bone Segmentation"):
+def create_orthogonal_views(image_data, output_path, title="CT Scan with Bone Segmentation", seg_data=None):
     """
     Create orthogonal views (axial, sagittal, coronal) of the image
+    If seg_data is given, segmented voxels are highlighted in each shown slice
     """
-    # Get the middle slices for each view
-    z_mid = image_data.shape[0] // 2
+    # Volumes written by SimpleITK load in (x, y, z) voxel order, so axial
+    # slices are taken along the last axis (same mapping as VIEW_AXES in
+    # visualize_results.py)
+    x_mid = image_data.shape[0] // 2
     y_mid = image_data.shape[1] // 2
-    x_mid = image_data.shape[2] // 2
+    z_mid = image_data.shape[2] // 2
+    index = {
+        'axial': (slice(None), slice(None), z_mid),
+        'sagittal': (x_mid, slice(None), slice(None)),
+        'coronal': (slice(None), y_mid, slice(None)),
+    }
+    
+    # Only three slices are shown, so build the overlay per slice
+    # instead of for the whole volume
+    views = {}
+    for view, idx in index.items():
+        orig_slice = np.asarray(image_data[idx])
+        if seg_data is not None:
+            seg_slice = np.asarray(seg_data[idx])
+            orig_slice = np.where(seg_slice > 0, orig_slice.max(), orig_slice)
+        views[view] = orig_slice
     
     # Create the figure
     fig, axes = plt.subplots(2, 2, figsize=(12, 12))
     fig.suptitle(title, fontsize=16)
     
     # Plot axial view (top-down)
-    axes[0, 0].imshow(image_data[z_mid, :, :], cmap='bone')
+    axes[0, 0].imshow(views['axial'], cmap='bone')
     axes[0, 0].set_title('Axial View')
     axes[0, 0].axis('off')
     
     # Plot sagittal view (side)
-    axes[0, 1].imshow(image_data[:, y_mid, :], cmap='bone')
+    axes[0, 1].imshow(views['sagittal'], cmap='bone')
     axes[0, 1].set_title('Sagittal View')
     axes[0, 1].axis('off')
     
     # Plot coronal view (front)
-    axes[1, 0].imshow(image_data[:, :, x_mid], cmap='bone')
+    axes[1, 0].imshow(views['coronal'], cmap='bone')
     axes[1, 0].set_title('Coronal View')
     axes[1, 0].axis('off')
     
@@ -44,6 +64,39 @@ def create_orthogonal_views(image_data, output_path, title="CT Scan with Bone Se
     plt.savefig(output_path)
     plt.close()
 
+def create_bone_mesh(image_data, threshold=0.5, step_size=2):
+    """
+    Extract the segmentation surface as a triangle mesh colored by height
+    Returns None if no voxel exceeds the threshold
+    """
+    if not np.any(image_data > threshold):
+        return None
+    
+    # Pad with a one-voxel background border so bone touching the volume edges
+    # still yields a closed surface, and a volume with no background has a level crossing
+    verts, faces, _, _ = measure.marching_cubes(
+        np.pad(np.asarray(image_data, dtype=np.float32), 1),
+        level=threshold,
+        step_size=step_size,
+        allow_degenerate=False
+    )
+    verts -= 1
+    triangles = verts[faces]
+    mesh = Poly3DCollection(triangles, alpha=0.3, linewidths=0)
+    mesh.set_array(triangles[:, :, 2].mean(axis=1))
+    mesh.set_cmap('viridis')
+    return mesh
+
+def _setup_3d_axes(ax, shape):
+    """Set labels, title and limits for a 3D view of a volume"""
+    ax.set_xlim(0, shape[0])
+    ax.set_ylim(0, shape[1])
+    ax.set_zlim(0, shape[2])
+    ax.set_xlabel('X')
+    ax.set_ylabel('Y')
+    ax.set_zlabel('Z')
+    ax.set_title('3D Bone Visualization')
+
 def create_3d_surface(image_data, output_path, threshold=0.5):
     """
     Create a 3D surface plot of the segmentation
@@ -52,20 +105,15 @@ def create_3d_surface(image_data, output_path, threshold=0.5):
     fig = plt.figure(figsize=(10, 10))
     ax = fig.add_subplot(111, projection='3d')
     
-    # Get the coordinates of segmented voxels
-    x, y, z = np.where(image_data > threshold)
-    
-    # Create the 3D scatter plot
-    scatter = ax.scatter(x, y, z, c=z, cmap='viridis', alpha=0.1, s=1)
+    # Extract the bone surface mesh
+    mesh = create_bone_mesh(image_data, threshold)
+    if mesh is not None:
+        ax.add_collection3d(mesh)
+        # Add a color bar
+        plt.colorbar(mesh, ax=ax)
     
     # Set labels and title
-    ax.set_xlabel('X')
-    ax.set_ylabel('Y')
-    ax.set_zlabel('Z')
-    ax.set_title('3D Bone Visualization')
-    
-    # Add a color bar
-    plt.colorbar(scatter)
+    _setup_3d_axes(ax, image_data.shape)
     
     # Save the figure
     plt.savefig(output_path)
@@ -78,21 +126,20 @@ def create_rotating_gif(image_data, output_path, threshold=0.5):
     fig = plt.figure(figsize=(10, 10))
     ax = fig.add_subplot(111, projection='3d')
     
-    # Get the coordinates of segmented voxels
-    x, y, z = np.where(image_data > threshold)
+    # Build the mesh once; frames only change the camera angle
+    mesh = create_bone_mesh(image_data, threshold)
+    if mesh is not None:
+        ax.add_collection3d(mesh)
+    _setup_3d_axes(ax, image_data.shape)
     
     def update(frame):
-        ax.clear()
-        ax.scatter(x, y, z, c=z, cmap='viridis', alpha=0.1, s=1)
         ax.view_init(elev=20., azim=frame)
-        ax.set_xlabel('X')
-        ax.set_ylabel('Y')
-        ax.set_zlabel('Z')
-        ax.set_title('3D Bone Visualization')
     
     # Create the animation
     anim = FuncAnimation(fig, update, frames=np.arange(0, 360, 2), repeat=True)
-    anim.save(output_path, writer='pillow', fps=15)
+    # ffmpeg encodes much faster than pillow; fall back to pillow when it is not installed
+    writer = 'ffmpeg' if writers.is_available('ffmpeg') else 'pillow'
+    anim.save(output_path, writer=writer, fps=20, dpi=80)
     plt.close()
 
 def main():
@@ -106,21 +153,20 @@ def main():
     for seg_file in seg_dir.glob("*_bone_seg.nii.gz"):
         print(f"Processing {seg_file.name}")
         
-        # Load the segmentation
+        # Load the segmentation in its stored dtype
         seg_img = nib.load(str(seg_file))
-        seg_data = seg_img.get_fdata()
+        seg_data = np.asanyarray(seg_img.dataobj)
         
-        # Get the corresponding original file
+        # Get the corresponding original file; the segmentation is overlaid
+        # slice by slice when drawing the orthogonal views
         orig_file = input_dir / seg_file.name.replace("_bone_seg.nii.gz", ".nii.gz")
         if orig_file.exists():
             orig_img = nib.load(str(orig_file))
-            orig_data = orig_img.get_fdata()
-            
-            # Create overlay of original and segmentation
-            overlay_data = np.copy(orig_data)
-            overlay_data[seg_data > 0] = np.max(orig_data)  # Highlight segmented regions
+            view_data = np.asanyarray(orig_img.dataobj)
+            overlay_seg = seg_data
         else:
-            overlay_data = seg_data
+            view_data = seg_data
+            overlay_seg = None
         
         # Generate base filename for outputs
         base_name = seg_file.stem.replace(".nii", "")
@@ -128,8 +174,9 @@ def main():
         # Create and save visualizations
         print("Creating orthogonal views...")
         create_orthogonal_views(
-            overlay_data,
-            viz_dir / f"{base_name}_orthogonal.png"
+            view_data,
+            viz_dir / f"{base_name}_orthogonal.png",
+            seg_data=overlay_seg
         )
         
         print("Creating 3D surface plot...")
@@ -7,43 +7,34 @@ import matplotlib.pyplot as plt
 from pathlib import Path
 import json
 from skimage.util import montage
-from skimage.transform import resize
 from matplotlib.colors import ListedColormap
 
+# Volume axis that each montage view slices along
+VIEW_AXES = {'axial': 2, 'sagittal': 0, 'coronal': 1}
+
 def create_view_montage(volume_data, view='axial', n_images=16):
     """Create a montage for a specific view"""
-    if view == 'axial':
-        slices = [volume_data[:, :, i] for i in np.linspace(0, volume_data.shape[2]-1, n_images, dtype=int)]
-    elif view == 'sagittal':
-        slices = [volume_data[i, :, :] for i in np.linspace(0, volume_data.shape[0]-1, n_images, dtype=int)]
-    else:  # coronal
-        slices = [volume_data[:, i, :] for i in np.linspace(0, volume_data.shape[1]-1, n_images, dtype=int)]
-    
-    # Normalize and resize slices to be square
-    max_dim = max(slices[0].shape)
-    normalized_slices = []
-    for slice_data in slices:
-        # Resize to square shape
-        if slice_data.shape[0] != slice_data.shape[1]:
-            resized = resize(slice_data, (max_dim, max_dim), preserve_range=True)
-        else:
-            resized = slice_data
-        # Normalize to [0, 1]
-        if resized.max() != resized.min():
-            normalized = (resized - resized.min()) / (resized.max() - resized.min())
-        else:
-            normalized = resized
-        normalized_slices.append(normalized)
+    # Gather evenly spaced slices in one go, slice index first
+    axis = VIEW_AXES.get(view, VIEW_AXES['coronal'])
+    idxs = np.linspace(0, volume_data.shape[axis]-1, n_images, dtype=int)
+    slices = np.moveaxis(np.take(volume_data, idxs, axis=axis), axis, 0).astype(np.float32)
     
-    # Stack slices into a 3D array
-    stacked_slices = np.stack(normalized_slices)
+    # Normalize each slice to [0, 1]; constant slices are left as they are
+    mn = slices.min(axis=(1, 2))
+    mx = slices.max(axis=(1, 2))
+    varying = mx != mn
+    slices -= np.where(varying, mn, 0)[:, None, None]
+    slices /= np.where(varying, mx - mn, 1)[:, None, None]
     
-    # Reshape to 4D array with channel axis
-    reshaped_slices = stacked_slices.reshape((-1, max_dim, max_dim, 1))
+    # Letterbox non-square slices to a square with zero padding
+    max_dim = max(slices.shape[1:])
+    pad_y = max_dim - slices.shape[1]
+    pad_x = max_dim - slices.shape[2]
+    if pad_y or pad_x:
+        slices = np.pad(slices, ((0, 0), (pad_y//2, pad_y - pad_y//2), (pad_x//2, pad_x - pad_x//2)))
     
     # Create montage
-    montage_array = montage(reshaped_slices, channel_axis=-1, padding_width=2)
-    return np.squeeze(montage_array)  # Remove channel axis for display
+    return montage(slices, padding_width=2)
 
 def create_segmentation_montages(ct_data, seg_data, output_path: Path):
     """Create montages for all three views"""
@@ -53,33 +44,40 @@ def create_segmentation_montages(ct_data, seg_data, output_path: Path):
     yellow_colors = np.array([[1, 1, 0, 0], [1, 1, 0, 0.7]])
     segmentation_cmap = ListedColormap(yellow_colors)
     
+    # Create one figure with two subplots side by side and reuse it for every view
+    fig, axes = plt.subplots(1, 2, figsize=(20, 10))
+    ct_images = None
+    mask_image = None
+    
     for view in views:
-        # Create figure with two subplots side by side
-        plt.figure(figsize=(20, 10))
-        
         # Create montages
         ct_montage = create_view_montage(ct_data, view)
         seg_montage = create_view_montage(seg_data, view)
-        
-        # Plot CT montage
-        plt.subplot(121)
-        plt.imshow(ct_montage, cmap='gray')
-        plt.title(f'{view.capitalize()} View - CT', fontsize=14)
-        plt.axis('off')
-        
-        # Plot segmentation montage with yellow mask
-        plt.subplot(122)
-        plt.imshow(ct_montage, cmap='gray')
         # Create a mask for segmentation
         mask = seg_montage > 0
-        # Apply color to segmented regions
-        plt.imshow(mask, cmap=segmentation_cmap, vmin=0, vmax=1)
-        plt.title(f'{view.capitalize()} View - Segmentation Mask', fontsize=14)
-        plt.axis('off')
         
-        plt.tight_layout()
-        plt.savefig(output_path / f'{view}_montage.png', bbox_inches='tight', dpi=300)
-        plt.close()
+        if ct_images is None:
+            # Plot CT montage, and the same CT under the yellow segmentation mask
+            ct_images = [ax.imshow(ct_montage, cmap='gray') for ax in axes]
+            mask_image = axes[1].imshow(mask, cmap=segmentation_cmap, vmin=0, vmax=1)
+            for ax in axes:
+                ax.axis('off')
+        else:
+            # Swap in the new montages; views can differ in size, so update the extent too
+            extent = (-0.5, ct_montage.shape[1] - 0.5, ct_montage.shape[0] - 0.5, -0.5)
+            for image, data in ((ct_images[0], ct_montage), (ct_images[1], ct_montage), (mask_image, mask)):
+                image.set_data(data)
+                image.set_extent(extent)
+            for image in ct_images:
+                image.autoscale()
+        
+        axes[0].set_title(f'{view.capitalize()} View - CT', fontsize=14)
+        axes[1].set_title(f'{view.capitalize()} View - Segmentation Mask', fontsize=14)
+        
+        fig.tight_layout()
+        fig.savefig(output_path / f'{view}_montage.png', bbox_inches='tight', dpi=150)
+    
+    plt.close(fig)
 
 def create_visualizations(nifti_file: str, seg_file: str, metrics_file: str, output_dir: str):
     """
@@ -89,9 +87,9 @@ def create_visualizations(nifti_file: str, seg_file: str, metrics_file: str, out
     nifti_img = nib.load(nifti_file)
     seg_img = nib.load(seg_file)
     
-    # Get data
-    ct_data = nifti_img.get_fdata()
-    seg_data = seg_img.get_fdata()
+    # Get data in its stored dtype rather than as float64 copies
+    ct_data = np.asanyarray(nifti_img.dataobj)
+    seg_data = np.asanyarray(seg_img.dataobj) > 0
     
     # Load metrics
     with open(metrics_file, 'r') as f:
@@ -103,9 +101,11 @@ def create_visualizations(nifti_file: str, seg_file: str, metrics_file: str, out
     
     # Create montages
     print("Creating montages...")
-    create_segmentation_montages(ct_data, seg_data, output_path)
+    # bool cannot be interpolated or normalized, so pass the mask as uint8
+    create_segmentation_montages(ct_data, seg_data.view(np.uint8), output_path)
     
     # Save metrics as JSON with additional information
+    bone_voxels = np.count_nonzero(seg_data)
     metrics_with_info = {
         'bone_metrics': {
             k: float(v) if isinstance(v, np.floating) else v 
@@ -118,8 +118,8 @@ def create_visualizations(nifti_file: str, seg_file: str, metrics_file: str, out
         },
         'segmentation_info': {
             'total_voxels': int(np.prod(ct_data.shape)),
-            'bone_voxels': int(np.sum(seg_data > 0)),
-            'bone_percentage': float(np.sum(seg_data > 0) / np.prod(ct_data.shape) * 100)
+            'bone_voxels': int(bone_voxels),
+            'bone_percentage': float(bone_voxels / np.prod(ct_data.shape) * 100)
         }
     }
     
@@ -128,29 +128,34 @@ def create_visualizations(nifti_file: str, seg_file: str, metrics_file: str, out
     
     print(f"Visualizations and metrics saved to {output_path}")
 
-def main():
-    try:
-        # Find input files
-        preprocessed_dir = Path("data/preprocessed")
-        segmentation_dir = Path("data/bone_segmentation")
-        output_dir = segmentation_dir / "visualizations"
+def visualize_directory(preprocessed_dir: str, segmentation_dir: str):
+    """
+    Create visualizations for every segmented NIfTI file
+    """
+    preprocessed_path = Path(preprocessed_dir)
+    segmentation_path = Path(segmentation_dir)
+    output_dir = segmentation_path / "visualizations"
+    
+    nifti_files = list(preprocessed_path.glob("*.nii.gz"))
+    
+    for nifti_file in nifti_files:
+        seg_file = segmentation_path / f"{nifti_file.stem}_bone_seg.nii.gz"
+        metrics_file = segmentation_path / f"{nifti_file.stem}_metrics.json"
         
-        nifti_files = list(preprocessed_dir.glob("*.nii.gz"))
+        if not all(f.exists() for f in [nifti_file, seg_file, metrics_file]):
+            print(f"Missing files for {nifti_file.name}")
+            continue
         
-        for nifti_file in nifti_files:
-            seg_file = segmentation_dir / f"{nifti_file.stem}_bone_seg.nii.gz"
-            metrics_file = segmentation_dir / f"{nifti_file.stem}_metrics.json"
-            
-            if not all(f.exists() for f in [nifti_file, seg_file, metrics_file]):
-                print(f"Missing files for {nifti_file.name}")
-                continue
-            
-            create_visualizations(
-                str(nifti_file),
-                str(seg_file),
-                str(metrics_file),
-                str(output_dir)
-            )
+        create_visualizations(
+            str(nifti_file),
+            str(seg_file),
+            str(metrics_file),
+            str(output_dir)
+        )
+
+def main():
+    try:
+        visualize_directory("data/preprocessed", "data/bone_segmentation")
     
     except Exception as e:
         print(f"Error creating visualizations: {str(e)}")